@@ -0,0 +1,115 @@
+/*
+ * Optional C fast path for vedirect.checksum() and vedirect.parse_frame().
+ * Same interface and results as the pure Python versions; vedirect.py
+ * picks this up automatically when it has been built:
+ *
+ *   cc -O2 -shared -fPIC $(python3-config --includes) _vedirect.c \
+ *      -o _vedirect$(python3-config --extension-suffix)
+ */
+#define PY_SSIZE_T_CLEAN
+#include <Python.h>
+#include <string.h>
+
+static unsigned char
+sum_bytes(const unsigned char *p, Py_ssize_t n)
+{
+    unsigned int s = 0;
+    Py_ssize_t i;
+    for (i = 0; i < n; i++)
+        s += p[i];
+    return (unsigned char)s;
+}
+
+static PyObject *
+checksum(PyObject *self, PyObject *arg)
+{
+    Py_buffer b;
+    unsigned char s;
+    if (PyObject_GetBuffer(arg, &b, PyBUF_SIMPLE) < 0)
+        return NULL;
+    s = sum_bytes(b.buf, b.len);
+    PyBuffer_Release(&b);
+    return PyLong_FromLong(s);
+}
+
+/* One "KEY\tVALUE" field; fields without a tab and the Checksum field are
+   skipped, exactly like str.partition() in the Python version. */
+static int
+add_field(PyObject *d, const char *p, Py_ssize_t n)
+{
+    const char *tab = memchr(p, '\t', n);
+    PyObject *k, *v;
+    int rc;
+    if (tab == NULL)
+        return 0;
+    if (tab - p == 8 && memcmp(p, "Checksum", 8) == 0)
+        return 0;
+    k = PyUnicode_DecodeLatin1(p, tab - p, NULL);
+    if (k == NULL)
+        return -1;
+    v = PyUnicode_DecodeLatin1(tab + 1, n - (tab - p) - 1, NULL);
+    if (v == NULL) {
+        Py_DECREF(k);
+        return -1;
+    }
+    rc = PyDict_SetItem(d, k, v);
+    Py_DECREF(k);
+    Py_DECREF(v);
+    return rc;
+}
+
+static PyObject *
+parse_frame(PyObject *self, PyObject *arg)
+{
+    Py_buffer b;
+    const char *p, *end, *start;
+    PyObject *d;
+    if (PyObject_GetBuffer(arg, &b, PyBUF_SIMPLE) < 0)
+        return NULL;
+    if (sum_bytes(b.buf, b.len) != 0) {
+        PyBuffer_Release(&b);
+        Py_RETURN_NONE;
+    }
+    d = PyDict_New();
+    if (d == NULL)
+        goto fail;
+    p = start = b.buf;
+    /* the trailing checksum byte can be anything, leave it out */
+    end = p + (b.len > 0 ? b.len - 1 : 0);
+    while (p + 1 < end) {
+        if (p[0] == '\r' && p[1] == '\n') {
+            if (add_field(d, start, p - start) < 0)
+                goto fail;
+            p += 2;
+            start = p;
+        }
+        else
+            p++;
+    }
+    if (add_field(d, start, end - start) < 0)
+        goto fail;
+    PyBuffer_Release(&b);
+    return d;
+fail:
+    Py_XDECREF(d);
+    PyBuffer_Release(&b);
+    return NULL;
+}
+
+static PyMethodDef methods[] = {
+    {"checksum", checksum, METH_O,
+     "checksum(buf) -> byte sum of buf mod 256"},
+    {"parse_frame", parse_frame, METH_O,
+     "parse_frame(buf) -> {key: value} for a valid frame, else None"},
+    {NULL, NULL, 0, NULL}
+};
+
+static struct PyModuleDef module = {
+    PyModuleDef_HEAD_INIT, "_vedirect", NULL, -1, methods
+};
+
+PyMODINIT_FUNC
+PyInit__vedirect(void)
+{
+    return PyModule_Create(&module);
+}
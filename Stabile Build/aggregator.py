@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Fleet aggregator: collects frames pushed by many VictronPi units
+(fleet.FleetPusher) into one SQLite time-series store.
+
+  POST /push    zlib-compressed
+                {"unit": id, "epoch": n, "frames": [[seq, ts, key, {...}]]}
+                -> {"ack": highest seq of this batch now stored}
+  GET  /units   -> {unit: {"epoch": n, "last_seq": n, "last_seen": ts}}
+
+Rows are keyed by (unit, epoch, seq): a batch re-sent after a lost ack
+is simply ignored, while a unit whose spool was wiped comes back with a
+new epoch and cannot collide with its old rows.  Each row holds only the
+fields that changed since the unit's last known state, or its full state
+when key=1; Store.frames() folds them back into complete frames.  One
+writer connection, WAL and one transaction per batch keep hundreds of
+units within a small box's reach.  Bodies are capped both as sent and
+as inflated, so a small zlib bomb cannot exhaust memory.
+
+Usage:
+  python aggregator.py [--host 0.0.0.0] [--port 8750] [--db fleet.db]
+"""
+import argparse
+import json
+import sqlite3
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from fleet import BatchTooLarge, decode_batch
+
+MAX_BODY = 16*1024*1024
+MAX_RAW = 64*1024*1024
+
+
+class Store:
+    def __init__(self, path):
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.lock = threading.Lock()
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute('PRAGMA synchronous=NORMAL')
+        self.db.execute('CREATE TABLE IF NOT EXISTS samples ('
+                        'unit TEXT, epoch INTEGER, seq INTEGER, ts REAL, '
+                        'key INTEGER, data TEXT, '
+                        'PRIMARY KEY (unit, epoch, seq)) WITHOUT ROWID')
+        self.db.execute('CREATE INDEX IF NOT EXISTS samples_unit_ts '
+                        'ON samples (unit, ts)')
+        self.db.execute('CREATE TABLE IF NOT EXISTS units ('
+                        'unit TEXT PRIMARY KEY, epoch INTEGER, '
+                        'last_seq INTEGER, last_seen REAL)')
+        self.db.commit()
+
+    def ingest(self, unit, epoch, frames):
+        rows = [(unit, epoch, int(seq), float(ts), int(key),
+                 json.dumps(data, separators=(',', ':')))
+                for seq, ts, key, data in frames]
+        if not rows:
+            return 0
+        last = max(r[2] for r in rows)
+        with self.lock, self.db:
+            self.db.executemany(
+                'INSERT OR IGNORE INTO samples VALUES (?,?,?,?,?,?)', rows)
+            self.db.execute(
+                'INSERT INTO units VALUES (?,?,?,?) ON CONFLICT(unit) DO '
+                'UPDATE SET last_seq=CASE WHEN epoch=excluded.epoch '
+                'THEN max(last_seq, excluded.last_seq) '
+                'ELSE excluded.last_seq END, '
+                'epoch=excluded.epoch, last_seen=excluded.last_seen',
+                (unit, epoch, last, time.time()))
+        # every row of the batch is now stored (inserted or a re-send)
+        return last
+
+    def units(self):
+        with self.lock:
+            rows = self.db.execute(
+                'SELECT unit, epoch, last_seq, last_seen FROM units').fetchall()
+        return {u: {'epoch': e, 'last_seq': s, 'last_seen': t}
+                for u, e, s, t in rows}
+
+    def frames(self, unit, t0, t1):
+        """Return [(ts, full frame)] for unit with t0 <= ts <= t1."""
+        with self.lock:
+            # every epoch starts with a keyframe, so folding in time order
+            # from the last keyframe at or before t0 is always complete
+            start = self.db.execute(
+                'SELECT max(ts) FROM samples WHERE unit=? AND key=1 '
+                'AND ts<=?', (unit, t0)).fetchone()[0]
+            rows = self.db.execute(
+                'SELECT ts, data FROM samples WHERE unit=? AND ts>=? '
+                'AND ts<=? ORDER BY ts, epoch, seq',
+                (unit, start if start is not None else t0, t1)).fetchall()
+        out, state = [], {}
+        for ts, data in rows:
+            state.update(json.loads(data))
+            if ts >= t0:
+                out.append((ts, dict(state)))
+        return out
+
+
+class Handler(BaseHTTPRequestHandler):
+    store = None
+
+    def _reply(self, code, obj):
+        body = json.dumps(obj).encode('utf-8')
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        if self.path != '/push':
+            return self._reply(404, {'error': 'not found'})
+        size = int(self.headers.get('Content-Length') or 0)
+        if not 0 < size <= MAX_BODY:
+            return self._reply(413, {'error': 'bad size'})
+        try:
+            batch = decode_batch(self.rfile.read(size), MAX_RAW)
+            ack = self.store.ingest(str(batch['unit']), int(batch['epoch']),
+                                    batch['frames'])
+        except BatchTooLarge:
+            return self._reply(413, {'error': 'batch too large'})
+        except (ValueError, KeyError, TypeError, zlib.error):
+            return self._reply(400, {'error': 'bad batch'})
+        self._reply(200, {'ack': ack})
+
+    def do_GET(self):
+        if self.path != '/units':
+            return self._reply(404, {'error': 'not found'})
+        self._reply(200, self.store.units())
+
+    def log_message(self, fmt, *args):
+        pass
+
+
+class FleetServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # a whole fleet reconnecting at once must not overflow the accept queue
+    request_queue_size = 512
+
+
+def serve(host, port, db_path):
+    Handler.store = Store(db_path)
+    return FleetServer((host, port), Handler)
+
+
+def main():
+    ap = argparse.ArgumentParser(description='VictronPi fleet aggregator')
+    ap.add_argument('--host', default='0.0.0.0')
+    ap.add_argument('--port', type=int, default=8750)
+    ap.add_argument('--db', default='fleet.db')
+    args = ap.parse_args()
+    server = serve(args.host, args.port, args.db)
+    print(f"Aggregator listening on {args.host}:{args.port}, store {args.db}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+if __name__ == '__main__':
+    main()
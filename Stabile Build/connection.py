@@ -0,0 +1,239 @@
+# -*- coding: utf-8 -*-
+"""
+Self-healing VE.Direct serial link.
+
+VictronLink.read() never gives up: a failed open or a vanished USB device
+just drops the port and the next call reconnects, waiting between attempts
+with an exponential backoff capped at backoff_max (0.5 s by default so a
+replug is back within a second).
+
+Ports are found by probing serial.tools.list_ports for a valid VE.Direct
+frame.  Each hit is cached on disk by USB serial number -> {device, PID,
+SER#}, so a reconnect (even onto a new /dev/ttyUSBn) opens the known
+adapter straight away instead of probing again.  Adapters that failed a
+probe (GPS, Zigbee, ...) are skipped for probe_retry_s, and at most one
+port is probed per attempt, so known ports are rechecked between probes.
+
+last_recovery_s is the replug-to-data time: from the moment the adapter
+shows up again (listed or opened) to the first bytes read.  The whole
+time the link was down is kept separately in last_outage_s.
+"""
+import json
+import time
+
+import serial
+from serial.tools import list_ports
+
+from vedirect import FrameReader
+
+
+class VictronLink:
+    eof = False
+
+    def __init__(self, port=None, baud=19200, timeout=0.1, cache_path=None,
+                 probe_s=2.5, stale_s=5.0, backoff_min=0.05, backoff_max=0.5,
+                 probe_retry_s=60.0):
+        self.port = port
+        self.baud = baud
+        self.timeout = timeout
+        self.cache_path = cache_path
+        self.probe_s = probe_s
+        self.stale_s = stale_s
+        self.backoff_min = backoff_min
+        self.backoff_max = backoff_max
+        self.probe_retry_s = probe_retry_s
+        self.cache = self._load_cache()
+        self._not_shunt = {}          # port key -> monotonic time to retry
+        self.ser = None
+        self.device = None
+        self._delay = backoff_min
+        self._last_rx = 0.0
+        self._got_data = False
+        self._lost_at = None
+        self._seen_at = None
+        self.last_recovery_s = None
+        self.last_outage_s = None
+
+    @classmethod
+    def from_config(cls, config, cache_path=None):
+        return cls(port=config.get('victron_port'),
+                   baud=config.get('victron_baud', 19200),
+                   timeout=config.get('victron_timeout', 0.1),
+                   cache_path=cache_path,
+                   probe_s=config.get('victron_probe_s', 2.5),
+                   stale_s=config.get('victron_stale_s', 5.0),
+                   backoff_max=config.get('victron_backoff_max_s', 0.5),
+                   probe_retry_s=config.get('victron_probe_retry_s', 60.0))
+
+    # ---- cache ----
+    def _load_cache(self):
+        if not self.cache_path:
+            return {}
+        try:
+            with open(self.cache_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save_cache(self):
+        if not self.cache_path:
+            return
+        try:
+            with open(self.cache_path, 'w', encoding='utf-8') as f:
+                json.dump(self.cache, f, indent=2)
+        except OSError:
+            pass
+
+    @staticmethod
+    def _key(p):
+        return p.serial_number or p.device
+
+    # ---- discovery ----
+    def _open(self, device):
+        return serial.Serial(device, self.baud, timeout=self.timeout)
+
+    def _probe(self, device):
+        """Open device and wait for one valid frame; return (ser, frame)."""
+        ser = self._open(device)
+        reader = FrameReader()
+        deadline = time.monotonic() + self.probe_s
+        try:
+            while time.monotonic() < deadline:
+                frames = reader.feed(ser.read(ser.in_waiting or 1))
+                if frames:
+                    return ser, frames[0]
+        except (serial.SerialException, OSError):
+            pass
+        ser.close()
+        return None, None
+
+    def _candidates(self):
+        ports = list_ports.comports()
+        now = time.monotonic()
+        known = [p for p in ports if self._key(p) in self.cache]
+        # USB adapters only; probing every on-board UART takes seconds each
+        unknown = [p for p in ports
+                   if self._key(p) not in self.cache and p.vid is not None
+                   and self._not_shunt.get(self._key(p), 0) <= now]
+        return known, unknown
+
+    def _connect(self):
+        now = time.monotonic()
+        known, unknown = self._candidates()
+        if known and self._seen_at is None:
+            self._seen_at = now         # the adapter is back on the bus
+        for p in known:
+            try:
+                self.ser = self._open(p.device)
+            except (serial.SerialException, OSError):
+                continue
+            self.device = p.device
+            if self.cache[self._key(p)].get('device') != p.device:
+                self.cache[self._key(p)]['device'] = p.device
+                self._save_cache()
+            return True
+        if self.port and self.port not in (p.device for p in known):
+            try:
+                self.ser = self._open(self.port)
+                self.device = self.port
+                return True
+            except (serial.SerialException, OSError):
+                pass
+        # one probe per attempt: a replugged shunt is picked up by the cheap
+        # known-port check above on the next call instead of waiting out
+        # every other adapter's probe
+        if unknown:
+            p = unknown[0]
+            probe_at = time.monotonic()
+            try:
+                ser, frame = self._probe(p.device)
+            except (serial.SerialException, OSError):
+                ser = None
+            if ser is None:
+                self._not_shunt[self._key(p)] = (time.monotonic()
+                                                 + self.probe_retry_s)
+                return False
+            self._not_shunt.pop(self._key(p), None)
+            if self._seen_at is None:
+                self._seen_at = probe_at
+            self.cache[self._key(p)] = {'device': p.device,
+                                        'pid': frame.get('PID'),
+                                        'ser': frame.get('SER#')}
+            self._save_cache()
+            self.ser, self.device = ser, p.device
+            return True
+        return False
+
+    def _forget(self, device):
+        # a cached adapter that never talks is no longer our shunt
+        stale = [k for k, v in self.cache.items() if v.get('device') == device]
+        for k in stale:
+            del self.cache[k]
+        if stale:
+            self._save_cache()
+
+    # ---- public ----
+    @property
+    def connected(self):
+        return self.ser is not None
+
+    def clock(self):
+        # monotonic: drives the derived averages, immune to NTP steps
+        return time.monotonic()
+
+    def stamp(self):
+        # wall time: what events and fleet rows are recorded with
+        return time.time()
+
+    def close(self):
+        if self.ser is not None:
+            try:
+                self.ser.close()
+            except (serial.SerialException, OSError):
+                pass
+        self.ser = None
+
+    def _drop(self):
+        self.close()
+        self._seen_at = None
+        if self._lost_at is None:
+            self._lost_at = time.monotonic()
+
+    def read(self):
+        """Return whatever bytes are available (b'' on timeout or while down)."""
+        if self.ser is None:
+            now = time.monotonic()
+            if not self._connect():
+                if self._lost_at is None:
+                    self._lost_at = time.monotonic()
+                time.sleep(self._delay)
+                self._delay = min(self._delay*2, self.backoff_max)
+                return b''
+            self._delay = self.backoff_min
+            if self._seen_at is None:
+                self._seen_at = now     # configured port opened
+            self._last_rx = time.monotonic()
+            self._got_data = False
+        try:
+            data = self.ser.read(self.ser.in_waiting or 1)
+        except (serial.SerialException, OSError):
+            self._drop()
+            return b''
+        now = time.monotonic()
+        if data:
+            self._last_rx = now
+            self._got_data = True
+            if self._lost_at is not None:
+                self.last_outage_s = now - self._lost_at
+                self.last_recovery_s = now - (self._seen_at or self._lost_at)
+                self._lost_at = None
+                print(f"VE.Direct link on {self.device} recovered in "
+                      f"{self.last_recovery_s:.3f} s after replug "
+                      f"(down {self.last_outage_s:.1f} s)")
+                self._seen_at = None
+        elif now - self._last_rx > self.stale_s:
+            # open but silent: cable pulled on the shunt side, or a dead port
+            if not self._got_data:
+                self._forget(self.device)
+            self._drop()
+        return data
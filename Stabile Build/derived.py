@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+"""
+Per-frame derived metrics for the SmartShunt.
+
+Fed one validated frame at a time, DerivedMetrics keeps a fixed amount of
+state (two EMAs and a fixed-size ring of current samples with a running
+sum), so each update is O(1) regardless of how long it has been running.
+
+Outputs (SI units, None when not yet known):
+  I_AVG    EMA-smoothed current (A, negative = discharging)
+  P_AVG    EMA-smoothed power (W)
+  TTG_EST  minutes to empty at the rolling average discharge current
+  TTF_EST  minutes to full at the rolling average charge current
+  ETA      TTG_EST while discharging, TTF_EST while charging
+  CAP_ADJ  remaining Ah corrected for the Peukert effect at that current
+"""
+import math
+import time
+from collections import deque
+
+
+class DerivedMetrics:
+    def __init__(self, capacity_ah=100.0, peukert=1.25, rated_hours=20.0,
+                 charge_efficiency=0.95, ema_tau_s=10.0, window=300,
+                 idle_a=0.1):
+        self.capacity_ah = float(capacity_ah)
+        self.peukert = float(peukert)
+        self.rated_a = self.capacity_ah / float(rated_hours)
+        self.charge_efficiency = float(charge_efficiency)
+        self.ema_tau_s = float(ema_tau_s)
+        self.idle_a = float(idle_a)
+        self._ring = deque(maxlen=int(window))
+        self._sum = 0.0
+        self._i_avg = None
+        self._p_avg = None
+        self._last_t = None
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(capacity_ah=config.get('battery_capacity_ah', 100.0),
+                   peukert=config.get('peukert_exponent', 1.25),
+                   rated_hours=config.get('battery_rated_hours', 20.0),
+                   charge_efficiency=config.get('charge_efficiency', 0.95),
+                   ema_tau_s=config.get('ema_tau_s', 10.0),
+                   window=config.get('ttg_window_frames', 300),
+                   idle_a=config.get('idle_current_a', 0.1))
+
+    def _ema(self, prev, x, alpha):
+        return x if prev is None else prev + alpha*(x - prev)
+
+    def update(self, frame, now=None):
+        now = time.monotonic() if now is None else now
+        try:
+            amps = int(frame['I'])/1000.0
+        except (KeyError, ValueError):
+            return {}
+        try:
+            watts = float(frame['P'])
+        except (KeyError, ValueError):
+            watts = None
+
+        # time-based alpha so a dropped frame doesn't distort the average
+        dt = 1.0 if self._last_t is None else max(now - self._last_t, 0.0)
+        self._last_t = now
+        alpha = 1.0 - math.exp(-dt/self.ema_tau_s) if self.ema_tau_s > 0 else 1.0
+        self._i_avg = self._ema(self._i_avg, amps, alpha)
+        if watts is not None:
+            self._p_avg = self._ema(self._p_avg, watts, alpha)
+
+        ring = self._ring
+        if len(ring) == ring.maxlen:
+            self._sum -= ring[0]
+        ring.append(amps)
+        self._sum += amps
+        mean = self._sum/len(ring)
+
+        remaining = self._remaining_ah(frame)
+        out = {'I_AVG': self._i_avg, 'P_AVG': self._p_avg,
+               'TTG_EST': None, 'TTF_EST': None, 'ETA': None,
+               'CAP_ADJ': remaining}
+        if remaining is None:
+            return out
+        if mean < -self.idle_a:
+            draw = -mean
+            # Peukert: at draw I the usable capacity scales by (I_rated/I)^(k-1)
+            adj = remaining*(self.rated_a/draw)**(self.peukert - 1.0)
+            out['CAP_ADJ'] = adj
+            out['TTG_EST'] = out['ETA'] = adj/draw*60.0
+        elif mean > self.idle_a:
+            missing = max(self.capacity_ah - remaining, 0.0)
+            out['TTF_EST'] = out['ETA'] = \
+                missing/(mean*self.charge_efficiency)*60.0
+        return out
+
+    def _remaining_ah(self, frame):
+        try:
+            return self.capacity_ah*int(frame['SOC'])/1000.0
+        except (KeyError, ValueError):
+            pass
+        try:
+            return max(self.capacity_ah + int(frame['CE'])/1000.0, 0.0)
+        except (KeyError, ValueError):
+            return None
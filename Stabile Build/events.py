@@ -0,0 +1,198 @@
+# -*- coding: utf-8 -*-
+"""
+Edge-triggered event detection and a compact append-only event log.
+
+EventDetector compares a handful of fields against their previous value
+on every frame and only does work when one of them changes.  Events are
+stored as fixed 16-byte records (time, type, value) in an append-only
+file; EventLog keeps the time column and one per-type time index in
+memory, so range queries by time and type are a bisect away.
+"""
+import struct
+from array import array
+from bisect import bisect_left, bisect_right
+
+ALARM_ON, ALARM_OFF, RELAY_ON, RELAY_OFF, LOW_SOC, SOC_OK, \
+    DISCONNECTED, CONNECTED, ERROR = range(1, 10)
+
+EVENT_NAMES = {
+    ALARM_ON: 'Alarm raised', ALARM_OFF: 'Alarm cleared',
+    RELAY_ON: 'Relay on', RELAY_OFF: 'Relay off',
+    LOW_SOC: 'Low SoC', SOC_OK: 'SoC recovered',
+    DISCONNECTED: 'Device disconnected', CONNECTED: 'Device connected',
+    ERROR: 'Charger error',
+}
+
+# VE.Direct AR (alarm reason) bit field
+ALARM_REASONS = [
+    (1, 'Low Voltage'), (2, 'High Voltage'), (4, 'Low SOC'),
+    (8, 'Low Starter Voltage'), (16, 'High Starter Voltage'),
+    (32, 'Low Temperature'), (64, 'High Temperature'),
+    (128, 'Mid Voltage'), (256, 'Overload'), (512, 'DC-ripple'),
+    (1024, 'Low V AC out'), (2048, 'High V AC out'),
+    (4096, 'Short Circuit'), (8192, 'BMS Lockout'),
+]
+
+RECORD = struct.Struct('<dB3xi')   # time, type, value -> 16 bytes
+
+
+def alarm_text(reason):
+    names = [name for bit, name in ALARM_REASONS if reason & bit]
+    return ', '.join(names) if names else 'Alarm'
+
+
+def _int(val, default=0):
+    try:
+        return int(val)
+    except (TypeError, ValueError):
+        return default
+
+
+class EventDetector:
+    def __init__(self, low_soc_pct=20.0, hysteresis_pct=2.0):
+        # SOC is reported in per-mille
+        self.low_soc = low_soc_pct*10
+        self.soc_ok = (low_soc_pct + hysteresis_pct)*10
+        self._alarm = None
+        self._reason = None
+        self._relay = None
+        self._err = None
+        self._soc = None
+        self._soc_low = False
+        self._link = None
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(low_soc_pct=config.get('low_soc_pct', 20.0),
+                   hysteresis_pct=config.get('low_soc_hysteresis_pct', 2.0))
+
+    def update(self, frame, t):
+        """Return [(t, type, value)] for whatever changed since last frame.
+
+        Fields missing from a frame keep their last value: BMV/SmartShunt
+        alternate a main block with a history block (H1...) that carries
+        none of them.
+        """
+        out = []
+        if 'Alarm' in frame or 'AR' in frame:
+            alarm = frame.get('Alarm', self._alarm)
+            reason = frame.get('AR', self._reason)
+            if alarm != self._alarm or reason != self._reason:
+                ar = _int(reason)
+                on = alarm == 'ON' or ar != 0
+                was = self.alarm_active
+                if on:
+                    # a new reason while already raised is its own event
+                    if not was or ar != _int(self._reason):
+                        out.append((t, ALARM_ON, ar))
+                elif was:
+                    out.append((t, ALARM_OFF, 0))
+                self._alarm, self._reason = alarm, reason
+        if 'Relay' in frame:
+            relay = frame['Relay']
+            if relay != self._relay:
+                if self._relay is not None:
+                    out.append((t, RELAY_ON if relay == 'ON' else RELAY_OFF, 0))
+                self._relay = relay
+        if 'ERR' in frame:
+            err = frame['ERR']
+            if err != self._err:
+                if _int(err) != 0:
+                    out.append((t, ERROR, _int(err)))
+                self._err = err
+        if 'SOC' in frame:
+            soc = frame['SOC']
+            if soc != self._soc:
+                self._soc, soc = soc, _int(soc, None)
+                if soc is not None:
+                    if not self._soc_low and soc < self.low_soc:
+                        self._soc_low = True
+                        out.append((t, LOW_SOC, soc))
+                    elif self._soc_low and soc >= self.soc_ok:
+                        self._soc_low = False
+                        out.append((t, SOC_OK, soc))
+        return out
+
+    def link(self, connected, t):
+        if connected == self._link:
+            return []
+        first, self._link = self._link is None, connected
+        if first and connected:
+            return []
+        return [(t, CONNECTED if connected else DISCONNECTED, 0)]
+
+    @property
+    def alarm_active(self):
+        return self._alarm == 'ON' or _int(self._reason) != 0
+
+    @property
+    def alarm_reason(self):
+        return _int(self._reason)
+
+
+class EventLog:
+    def __init__(self, path=None):
+        self.path = path
+        self.times = array('d')
+        self.types = array('B')
+        self.values = array('i')
+        self._by_type = {}            # type -> (times, record indices)
+        self._f = None
+        if path:
+            self._load()
+            self._f = open(path, 'ab')
+
+    def _load(self):
+        try:
+            with open(self.path, 'rb') as f:
+                data = f.read()
+        except OSError:
+            return
+        # drop a torn last record left by a power cut mid-write
+        usable = len(data) - len(data) % RECORD.size
+        for t, kind, value in RECORD.iter_unpack(data[:usable]):
+            self._index(t, kind, value)
+        if usable != len(data):
+            with open(self.path, 'r+b') as f:
+                f.truncate(usable)
+
+    def _index(self, t, kind, value):
+        if self.times and t < self.times[-1]:
+            t = self.times[-1]        # keep the time column sorted
+        times, idx = self._by_type.setdefault(kind, (array('d'), array('I')))
+        times.append(t)
+        idx.append(len(self.times))
+        self.times.append(t)
+        self.types.append(kind)
+        self.values.append(value)
+
+    def append(self, t, kind, value=0):
+        self._index(t, kind, value)
+        if self._f:
+            self._f.write(RECORD.pack(self.times[-1], kind, value))
+            self._f.flush()
+
+    def extend(self, events):
+        for t, kind, value in events:
+            self.append(t, kind, value)
+
+    def __len__(self):
+        return len(self.times)
+
+    def query(self, t0=None, t1=None, kind=None):
+        """Return [(t, type, value)] with t0 <= t <= t1, optionally one type."""
+        if kind is None:
+            times, idx = self.times, None
+        elif kind in self._by_type:
+            times, idx = self._by_type[kind]
+        else:
+            return []
+        lo = 0 if t0 is None else bisect_left(times, t0)
+        hi = len(times) if t1 is None else bisect_right(times, t1)
+        rows = range(lo, hi) if idx is None else idx[lo:hi]
+        return [(self.times[i], self.types[i], self.values[i]) for i in rows]
+
+    def close(self):
+        if self._f:
+            self._f.close()
+            self._f = None
@@ -0,0 +1,269 @@
+# -*- coding: utf-8 -*-
+"""
+Push this unit's VE.Direct frames to a fleet aggregator (aggregator.py).
+
+record() is called per frame from the serial thread and only stores the
+fields that changed since the unit's last known state (a keyframe with
+the full state every keyframe_every frames).  A background thread moves
+those deltas into a local SQLite spool and POSTs them in zlib-compressed
+JSON batches; rows are only removed once the aggregator acks their
+sequence number, so a unit that is offline just keeps spooling and
+catches up later.
+
+Sequence numbers survive restarts and are scoped by a random epoch
+created with the spool, so a re-sent batch is a no-op server-side while
+a wiped spool starts a fresh epoch instead of colliding with rows
+already stored.  A cloned SD card carries the spool (and machine-id)
+along, so the spool also records the Pi's CPU serial: opened on another
+board it drops the source unit's rows and starts a fresh epoch.  Boards
+without a CPU serial cannot tell a clone apart.  unit_id defaults to the
+hostname plus the CPU serial (or machine-id), since stock images all
+share one hostname.
+"""
+import http.client
+import json
+import secrets
+import socket
+import sqlite3
+import threading
+import urllib.request
+import zlib
+
+
+def encode_batch(unit, epoch, rows):
+    body = json.dumps({'unit': unit, 'epoch': epoch, 'frames': rows},
+                      separators=(',', ':'))
+    return zlib.compress(body.encode('utf-8'))
+
+
+class BatchTooLarge(ValueError):
+    pass
+
+
+def decode_batch(data, max_raw=0):
+    """Inverse of encode_batch; max_raw bounds the decompressed size."""
+    d = zlib.decompressobj()
+    raw = d.decompress(data, max_raw)
+    if d.unconsumed_tail:
+        raise BatchTooLarge(f"batch inflates past {max_raw} bytes")
+    if not d.eof:
+        raise ValueError('truncated batch')
+    return json.loads(raw.decode('utf-8'))
+
+
+def cpu_serial():
+    """The Pi's CPU serial from /proc/cpuinfo, or None."""
+    try:
+        with open('/proc/cpuinfo', 'r') as f:
+            for line in f:
+                if line.startswith('Serial'):
+                    return line.split(':', 1)[1].strip().lstrip('0') or None
+    except OSError:
+        pass
+    return None
+
+
+def default_unit_id():
+    """hostname-<first 8 of Pi serial or machine-id>, or None if neither."""
+    # the CPU serial first: machine-id is copied along with a cloned card
+    ident = cpu_serial()
+    if not ident:
+        try:
+            with open('/etc/machine-id', 'r') as f:
+                ident = f.read().strip()
+        except OSError:
+            pass
+    return f"{socket.gethostname()}-{ident[:8]}" if ident else None
+
+
+class FleetPusher:
+    def __init__(self, url, unit, spool_path, interval_s=10.0, batch=500,
+                 keyframe_every=60, spool_max_rows=7*24*3600,
+                 timeout=10.0, queue_max=3600):
+        self.url = url.rstrip('/') + '/push'
+        self.unit = unit
+        self.spool_path = spool_path
+        self.interval_s = interval_s
+        self.batch = batch
+        self.keyframe_every = keyframe_every
+        self.spool_max_rows = spool_max_rows
+        self.timeout = timeout
+        self.queue_max = queue_max
+        self._last = {}
+        self._count = 0
+        self._queue = []
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = False
+        self.acked = None
+        self.error = None
+        self.epoch = None
+        self.db = None
+
+    @classmethod
+    def from_config(cls, config, spool_path):
+        return cls(config['fleet_url'],
+                   config.get('unit_id') or default_unit_id(),
+                   spool_path,
+                   interval_s=config.get('fleet_push_interval_s', 10.0),
+                   batch=config.get('fleet_batch', 500),
+                   keyframe_every=config.get('fleet_keyframe_every', 60),
+                   spool_max_rows=config.get('fleet_spool_max_rows',
+                                             7*24*3600),
+                   queue_max=config.get('fleet_queue_max', 3600))
+
+    # ---- serial thread ----
+    def record(self, frame, t):
+        # deltas are taken against the merged state of all blocks seen so
+        # far, not the previous block: the shunt alternates main and
+        # history blocks, which would otherwise make every row a full one
+        last = self._last
+        delta = {k: v for k, v in frame.items() if last.get(k) != v}
+        last.update(frame)
+        key = 0
+        if self._count % self.keyframe_every == 0:
+            delta, key = dict(last), 1
+        self._count += 1
+        with self._lock:
+            if len(self._queue) >= self.queue_max:
+                # spool unusable for a long time: drop the backlog rather
+                # than grow until the Pi runs out of memory, and restart
+                # with a keyframe so what follows still folds
+                self._queue.clear()
+                delta, key = dict(last), 1
+            self._queue.append((t, key, delta))
+
+    # ---- push thread ----
+    def _open(self):
+        db = sqlite3.connect(self.spool_path)
+        db.execute('PRAGMA journal_mode=WAL')
+        db.execute('CREATE TABLE IF NOT EXISTS outbox ('
+                   'seq INTEGER PRIMARY KEY, ts REAL, key INTEGER, data TEXT)')
+        db.execute('CREATE TABLE IF NOT EXISTS meta ('
+                   'name TEXT PRIMARY KEY, value INTEGER)')
+        # 'cpu:' keeps an all-digit serial from turning into an integer
+        hw = cpu_serial()
+        hw = hw and f"cpu:{hw}"
+        row = db.execute("SELECT value FROM meta WHERE name='hw'").fetchone()
+        if hw and row and row[0] != hw:
+            # spool cloned from another board: its rows and seqs are that
+            # unit's, so drop them and start over under a new epoch
+            print("Fleet spool was created on another board, starting fresh")
+            db.execute('DELETE FROM outbox')
+            db.execute("DELETE FROM meta WHERE name IN ('epoch','next_seq')")
+        if hw:
+            db.execute("INSERT OR REPLACE INTO meta VALUES ('hw',?)", (hw,))
+        db.execute("INSERT OR IGNORE INTO meta VALUES ('epoch',?)",
+                   (secrets.randbits(62),))
+        db.commit()
+        self.epoch = db.execute(
+            "SELECT value FROM meta WHERE name='epoch'").fetchone()[0]
+        if not self.unit:
+            self.unit = f"{socket.gethostname()}-{self.epoch:x}"[:40]
+        return db
+
+    def _next_seq(self):
+        row = self.db.execute(
+            "SELECT value FROM meta WHERE name='next_seq'").fetchone()
+        return row[0] if row else 1
+
+    def _spool(self):
+        with self._lock:
+            queue, self._queue = self._queue, []
+        if not queue:
+            return
+        try:
+            self._write(queue)
+        except sqlite3.Error:
+            with self._lock:
+                self._queue[:0] = queue     # retry next round
+            raise
+
+    def _write(self, queue):
+        seq = self._next_seq()
+        with self.db:
+            self.db.executemany(
+                'INSERT INTO outbox VALUES (?,?,?,?)',
+                ((seq + i, t, key, json.dumps(d, separators=(',', ':')))
+                 for i, (t, key, d) in enumerate(queue)))
+            self.db.execute("INSERT OR REPLACE INTO meta VALUES ('next_seq',?)",
+                            (seq + len(queue),))
+            # bounded spool (rows; the default is a week at one frame/s):
+            # a unit offline for longer drops its oldest rows, cutting at
+            # a keyframe so the rows left behind still fold into frames
+            low = seq + len(queue) - self.spool_max_rows
+            if self.db.execute('SELECT 1 FROM outbox WHERE seq < ? LIMIT 1',
+                               (low,)).fetchone():
+                cut = self.db.execute(
+                    'SELECT min(seq) FROM outbox WHERE key=1 AND seq>=?',
+                    (low,)).fetchone()[0]
+                if cut is not None:
+                    self.db.execute('DELETE FROM outbox WHERE seq < ?',
+                                    (cut,))
+
+    def _send(self):
+        """Send one batch; return True if there may be more to send."""
+        rows = self.db.execute(
+            'SELECT seq, ts, key, data FROM outbox ORDER BY seq LIMIT ?',
+            (self.batch,)).fetchall()
+        if not rows:
+            return False
+        payload = encode_batch(self.unit, self.epoch,
+                               [[s, t, k, json.loads(d)]
+                                for s, t, k, d in rows])
+        req = urllib.request.Request(
+            self.url, data=payload, method='POST',
+            headers={'Content-Type': 'application/json',
+                     'Content-Encoding': 'deflate'})
+        with urllib.request.urlopen(req, timeout=self.timeout) as resp:
+            ack = json.loads(resp.read().decode('utf-8'))['ack']
+        # only ever drop what this batch contained
+        ack = min(int(ack), rows[-1][0])
+        with self.db:
+            self.db.execute('DELETE FROM outbox WHERE seq <= ?', (ack,))
+        self.acked = ack
+        return len(rows) == self.batch
+
+    def flush(self):
+        self._spool()
+        try:
+            while self._send():
+                pass
+        except (OSError, ValueError, KeyError, TypeError,
+                http.client.HTTPException):
+            # offline or aggregator unhappy: keep spooling, retry later
+            pass
+
+    def _step(self):
+        try:
+            if self.db is None:
+                self.db = self._open()
+            self.flush()
+            self.error = None
+        except sqlite3.Error as e:
+            # full or corrupt SD card: keep the thread, retry next round
+            if self.error is None:
+                print(f"Fleet spool error: {e}")
+            self.error = e
+            if self.db is not None:
+                self.db.close()
+                self.db = None
+
+    def _run(self):
+        while not self._stop:
+            self._step()
+            self._wake.wait(self.interval_s)
+            self._wake.clear()
+        self._step()
+        if self.db is not None:
+            self.db.close()
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop = True
+        self._wake.set()
+        self._thread.join()
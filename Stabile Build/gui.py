@@ -1,12 +1,18 @@
 # -*- coding: utf-8 -*-
 import tkinter as tk
 from tkinter import ttk, messagebox
+import argparse
 import json
 import os
 import threading
-import serial
 import time
-import re
+
+from vedirect import FrameReader
+from derived import DerivedMetrics
+from connection import VictronLink
+from replay import ReplaySource
+from events import EventDetector, EventLog, alarm_text
+from fleet import FleetPusher
 
 # ====== Relay & GPIO Setup ======
 try:
@@ -22,18 +28,51 @@ try:
         config = json.load(f)
 except Exception:
     config = {}
+PORT_CACHE_PATH = os.path.join(os.path.dirname(__file__), 'port_cache.json')
+EVENT_LOG_PATH  = os.path.join(os.path.dirname(__file__),
+                               config.get('event_log', 'events.log'))
+FLEET_SPOOL_PATH = os.path.join(os.path.dirname(__file__), 'fleet_spool.db')
 
 # GPIO & relay
 GPIO_OPTIONS = config.get('gpio_options', list(range(2, 28)))
 relay_pins    = config.get('relay_pins', [])
 
 # VE.Direct parsing
-DISPLAY_TAGS = ['V','I','P','SOC','CE','TTG']
+DISPLAY_TAGS = ['V','I','P','SOC','CE','TTG',
+                'I_AVG','P_AVG','TTG_EST','TTF_EST','CAP_ADJ']
 TAG_LABELS   = {
     'V':'Voltage (V)', 'I':'Current (A)', 'P':'Power (W)',
-    'SOC':'State of Charge (%)','CE':'Consumed Ah','TTG':'Time to Go'
+    'SOC':'State of Charge (%)','CE':'Consumed Ah','TTG':'Time to Go',
+    'I_AVG':'Avg Current (A)', 'P_AVG':'Avg Power (W)',
+    'TTG_EST':'Est. Time to Go', 'TTF_EST':'Est. Time to Full',
+    'ETA':'Time Left', 'CAP_ADJ':'Usable Ah'
 }
-TAG_PATTERN = re.compile(r'^([A-Z0-9]{1,4})\t(.+)$')
+
+def _fmt_minutes(t):
+    t = int(t)
+    return ('--' if t<0 else
+            f"{t} m" if t<60 else
+            f"{t/60:.1f} h" if t<1440 else
+            f"{t/1440:.1f} d")
+
+def format_value(key, val):
+    # raw VE.Direct fields arrive as strings, derived ones as SI floats
+    if val is None:
+        return '--'
+    try:
+        num = float(val)
+    except (TypeError, ValueError):
+        return str(val)
+    if key=='V':     return f"{num/1000:.1f}"
+    if key=='I':     return f"{num/1000:.2f}"
+    if key=='P':     return f"{num:.0f}"
+    if key=='SOC':   return f"{num/10:.1f}%"
+    if key=='CE':    return f"{num/1000:.1f} Ah"
+    if key=='I_AVG': return f"{num:.2f}"
+    if key=='P_AVG': return f"{num:.0f}"
+    if key=='CAP_ADJ': return f"{num:.1f} Ah"
+    if key in ('TTG','TTG_EST','TTF_EST','ETA'): return _fmt_minutes(num)
+    return str(val)
 
 # UI constants
 off_color    = config.get('off_color','#FF5D62')
@@ -50,7 +89,7 @@ nav_height   = config.get('navbar_height_px',80)
 rows         = config.get('grid_rows',2)
 cols         = config.get('grid_cols',4)
 gap          = config.get('grid_gap_px',5)
-NAV_TAGS     = ['V','SOC','P','TTG']
+NAV_TAGS     = config.get('nav_tags', ['V','SOC','P_AVG','ETA'])
 
 # Language loader
 languages = config.get('languages',{})
@@ -59,8 +98,17 @@ def translate(key):
     return languages.get(current_language,{}).get(key,key)
 
 class ToggleGridApp:
-    def __init__(self, root):
+    def __init__(self, root, source=None):
         self.root = root
+        self.source = source
+        self._pending = {}
+        self._ui_lock = threading.Lock()
+        self.alarm = None
+        # replayed captures must not end up in the device's own history
+        self.events = EventLog(None if source else EVENT_LOG_PATH)
+        self.fleet = None
+        if config.get('fleet_url') and not source:
+            self.fleet = FleetPusher.from_config(config, FLEET_SPOOL_PATH).start()
         root.title(config.get('window_title','GUI'))
         root.attributes('-fullscreen', True)
         root.bind('<Escape>', lambda e: root.attributes('-fullscreen', False))
@@ -144,9 +192,13 @@ class ToggleGridApp:
             lbl.place(relx=0.5, rely=0.55, anchor=tk.CENTER)
             self.nav_labels[tag] = lbl
 
+        # Alarm banner, only placed while an alarm is active
+        self.alarm_banner = tk.Label(frame, text='', font=(font_family,14),
+                                     fg=root_bg, bg=off_color)
+
         # Relay grid
         grid = tk.Frame(frame, bg=root_bg)
-        grid.place(relx=0, rely=nav_r, relwidth=1, relheight=1-nav_r)
+        self.grid_frame = grid
         for r in range(rows):   grid.rowconfigure(r, weight=1)
         for c in range(cols):   grid.columnconfigure(c, weight=1)
         self.buttons = []
@@ -164,6 +216,25 @@ class ToggleGridApp:
             for w in (cell, ind, lbl):
                 w.bind('<Button-1>', lambda e,i=idx: self._toggle(i))
             self.buttons.append((cell, ind, lbl))
+        self._render_banner()
+
+    def _render_banner(self):
+        nav_r = nav_height/window_height
+        ban_r = nav_r/2 if self.alarm is not None else 0
+        if ban_r:
+            self.alarm_banner.configure(
+                text=f"{translate('alarm')}: {alarm_text(self.alarm)}")
+            self.alarm_banner.place(relx=0, rely=nav_r,
+                                    relwidth=1, relheight=ban_r)
+        else:
+            self.alarm_banner.place_forget()
+        self.grid_frame.place(relx=0, rely=nav_r+ban_r,
+                              relwidth=1, relheight=1-nav_r-ban_r)
+
+    def _set_alarm(self, reason):
+        if reason != self.alarm:
+            self.alarm = reason
+            self._render_banner()
 
     def _build_settings_tab(self):
         frame = self.frames[translate('pages')[2]]
@@ -301,49 +372,83 @@ class ToggleGridApp:
 
         messagebox.showinfo('', translate('settings_saved'))
 
-    def _victron_loop(self):
-        try:
-            ser = serial.Serial(config.get('victron_port','/dev/ttyUSB0'),
-                                config.get('victron_baud',19200),
-                                timeout=config.get('victron_timeout',0.1))
-        except:
+    def _publish(self, values):
+        # Raw and derived tags share this path. Updates are coalesced into
+        # one pending Tk callback, so a fast replay can't flood the UI.
+        with self._ui_lock:
+            first = not self._pending
+            self._pending.update(values)
+        if first:
+            self.root.after(0, self._apply_texts)
+
+    def _apply_texts(self):
+        with self._ui_lock:
+            values, self._pending = self._pending, {}
+        for k, v in values.items():
+            if k in self.widgets:
+                self.widgets[k].config(text=format_value(k, v))
+            if k in self.nav_labels:
+                self.nav_labels[k].config(text=format_value(k, v))
+
+    def _on_events(self, detect, found):
+        if not found:
             return
-        while True:
-            raw = ser.readline()
+        self.events.extend(found)
+        reason = detect.alarm_reason if detect.alarm_active else None
+        self.root.after(0, self._set_alarm, reason)
+
+    def _victron_loop(self):
+        source  = self.source or VictronLink.from_config(config, PORT_CACHE_PATH)
+        reader  = FrameReader()
+        derived = DerivedMetrics.from_config(config)
+        detect  = EventDetector.from_config(config)
+        started = time.monotonic()
+        link_up = None
+        while not source.eof:
+            raw = source.read()
+            if source.connected != link_up:
+                link_up = source.connected
+                self._on_events(detect, detect.link(link_up, source.stamp()))
             if not raw:
-                time.sleep(config.get('victron_poll_interval_ms',100)/1000.0)
+                if source.connected and not source.eof:
+                    time.sleep(config.get('victron_poll_interval_ms',100)/1000.0)
                 continue
-            line = raw.decode('ascii','ignore').strip()
-            m = TAG_PATTERN.match(line)
-            if not m: continue
-            key,val = m.groups()
-            text = val
-            try:
-                num = float(val)
-                if key=='V':   text=f"{num/1000:.1f}"
-                elif key=='I': text=f"{num/1000:.2f}"
-                elif key=='P': text=f"{num:.0f}"
-                elif key=='SOC': text=f"{num/10:.1f}%"
-                elif key=='CE':  text=f"{num/1000:.1f} Ah"
-                elif key=='TTG':
-                    t=int(num)
-                    text = ('--' if t<0 else
-                            f"{t} m" if t<60 else
-                            f"{t/60:.1f} h" if t<1440 else
-                            f"{t/1440:.1f} d")
-            except:
-                pass
-
-            if key in self.widgets:
-                self.root.after(0, lambda k=key,t=text:
-                                self.widgets[k].config(text=t))
-            if key in self.nav_labels:
-                self.root.after(0, lambda k=key,t=text:
-                                self.nav_labels[k].config(text=t))
+            for frame in reader.feed(raw):
+                stamp = source.stamp()
+                if self.fleet:
+                    self.fleet.record(frame, stamp)
+                frame.update(derived.update(frame, now=source.clock()))
+                self._publish(frame)
+                found = detect.update(frame, stamp)
+                if found:
+                    self._on_events(detect, found)
+        took = time.monotonic() - started
+        print(f"Replay finished: {reader.frames} frames "
+              f"({reader.errors} bad) in {took:.2f} s, "
+              f"{reader.frames/max(took,1e-9):.0f} frames/s")
 
 def main():
+    ap = argparse.ArgumentParser(description=config.get('window_title','GUI'))
+    ap.add_argument('--replay', metavar='CAPTURE',
+                    help='drive the GUI from a recorded VE.Direct capture')
+    ap.add_argument('--speed', type=float, default=1.0,
+                    help='replay speed multiplier, 0 = as fast as possible')
+    ap.add_argument('--seek', type=float, default=0.0, metavar='SECONDS',
+                    help='start the replay this far into the capture')
+    ap.add_argument('--frame-interval', type=float, default=1.0,
+                    metavar='SECONDS',
+                    help='capture time between main blocks (default 1)')
+    ap.add_argument('--loop', action='store_true', help='restart at end')
+    args = ap.parse_args()
+
+    source = None
+    if args.replay:
+        source = ReplaySource(args.replay, speed=args.speed,
+                              frame_interval=args.frame_interval,
+                              loop=args.loop)
+        source.seek(args.seek)
     root = tk.Tk()
-    app  = ToggleGridApp(root)
+    app  = ToggleGridApp(root, source)
     root.mainloop()
 
 if __name__ == '__main__':
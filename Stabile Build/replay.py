@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+"""
+Offline replay of a recorded VE.Direct capture.
+
+A capture is the raw byte stream off the port (PuTTY log, `cat
+/dev/ttyUSB0 > capture.log`, ...).  ReplaySource has the same read()
+interface as connection.VictronLink, so the GUI runs the exact same
+frame -> derived -> UI path on it.
+
+The file is mmap'd and indexed once by block end offset and capture
+tick, so a week-long capture costs 12 bytes of RAM per block and seeking
+is a bisect.  Devices send their main block (the one carrying V or I)
+once per frame_interval; extra blocks such as the BMV/SmartShunt history
+block (H1...) share its tick, so the capture clock does not run slow.
+That clock drives pacing: speed=1 is real time, speed=N is N x, speed=0
+is as fast as possible.
+"""
+import mmap
+import time
+from array import array
+from bisect import bisect_left
+
+from vedirect import CHECKSUM_TAG
+
+
+class ReplaySource:
+    connected = True
+
+    def __init__(self, path, speed=1.0, frame_interval=1.0, loop=False):
+        self.path = path
+        self.speed = float(speed)
+        self.frame_interval = float(frame_interval)
+        self.loop = loop
+        self.eof = False
+        self._f = open(path, 'rb')
+        try:
+            self._mm = mmap.mmap(self._f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            self._mm = b''   # empty file
+        self._ends, self._ticks = self._index()
+        self.pos = 0
+        self._anchor()
+
+    def _index(self):
+        ends, ticks = array('Q'), array('I')
+        mm, step = self._mm, len(CHECKSUM_TAG) + 1
+        start, mains = 0, 0
+        i = mm.find(CHECKSUM_TAG)
+        while i >= 0 and i + step <= len(mm):
+            main = (mm.find(b'\r\nV\t', start, i) >= 0 or
+                    mm.find(b'\r\nI\t', start, i) >= 0)
+            ticks.append(mains if main else max(mains - 1, 0))
+            mains += main
+            start = i + step
+            ends.append(start)
+            i = mm.find(CHECKSUM_TAG, start)
+        if not mains:
+            # no V/I anywhere (unknown device): one block per tick
+            ticks = array('I', range(len(ends)))
+        return ends, ticks
+
+    def _anchor(self):
+        self._t0 = time.monotonic()
+        self._c0 = self._tick(self.pos)*self.frame_interval
+
+    def _tick(self, pos):
+        ticks = self._ticks
+        if pos < len(ticks):
+            return ticks[pos]
+        return ticks[-1] + 1 if ticks else 0
+
+    def __len__(self):
+        return len(self._ends)
+
+    @property
+    def duration(self):
+        return self._tick(len(self._ends))*self.frame_interval
+
+    def clock(self):
+        """Capture time (s) of the block last returned by read()."""
+        return self._tick(max(self.pos - 1, 0))*self.frame_interval
+
+    # a capture only has its own clock; events are stamped with it too
+    stamp = clock
+
+    def seek(self, seconds):
+        tick = max(int(seconds/self.frame_interval), 0)
+        self.pos = bisect_left(self._ticks, tick)
+        self.eof = False
+        self._anchor()
+
+    def read(self):
+        """Return the next block's raw bytes, paced to the capture clock."""
+        if self.pos >= len(self._ends):
+            if self.loop and self._ends:
+                self.seek(0)
+            else:
+                self.eof = True
+                return b''
+        if self.speed > 0:
+            due = (self._t0 + (self._tick(self.pos)*self.frame_interval
+                               - self._c0)/self.speed)
+            wait = due - time.monotonic()
+            if wait > 0:
+                time.sleep(wait)
+        start = self._ends[self.pos - 1] if self.pos else 0
+        self.pos += 1
+        return self._mm[start:self._ends[self.pos - 1]]
+
+    def close(self):
+        if isinstance(self._mm, mmap.mmap):
+            self._mm.close()
+        self._f.close()
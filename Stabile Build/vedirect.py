@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+"""
+VE.Direct text-protocol framing.
+
+A frame is a run of "\\r\\n<KEY>\\t<VALUE>" fields closed by a
+"\\r\\nChecksum\\t<byte>" field; the byte sum of the whole frame is 0 mod 256.
+FrameReader takes raw bytes as they arrive from the port and hands back
+one dict per frame that passes the checksum.
+
+checksum() and parse_frame() are replaced by the C versions from
+_vedirect.c when that extension has been built next to this file (see
+the build line at the top of _vedirect.c); ACCELERATED tells which ones
+are in use.  py_checksum / py_parse_frame always name the Python ones.
+"""
+
+CHECKSUM_TAG = b'Checksum\t'
+
+
+def checksum(buf):
+    return sum(buf) & 0xFF
+
+
+def parse_frame(buf):
+    """Return {key: value} for a complete frame, or None if it is corrupt."""
+    if sum(buf) & 0xFF:
+        return None
+    data = {}
+    # drop the trailing checksum byte; it can be any value incl. \r or \t
+    for field in buf[:-1].decode('latin-1').split('\r\n'):
+        key, sep, val = field.partition('\t')
+        if sep and key != 'Checksum':
+            data[key] = val
+    return data
+
+
+py_checksum, py_parse_frame = checksum, parse_frame
+try:
+    from _vedirect import checksum, parse_frame
+    ACCELERATED = True
+except ImportError:
+    ACCELERATED = False
+
+
+class FrameReader:
+    def __init__(self, max_buffer=4096, parse=None):
+        self.max_buffer = max_buffer
+        self._parse = parse or parse_frame
+        self._buf = bytearray()
+        self.frames = 0
+        self.errors = 0
+
+    def reset(self):
+        self._buf.clear()
+
+    def feed(self, data):
+        """Append raw bytes, return the list of valid frames completed by them."""
+        buf = self._buf
+        buf += data
+        out = []
+        while True:
+            i = buf.find(CHECKSUM_TAG)
+            end = i + len(CHECKSUM_TAG) + 1
+            if i < 0 or end > len(buf):
+                break
+            # a frame starts at the "\r\n" that ended the previous one
+            frame = self._parse(buf[:end])
+            del buf[:end]
+            if frame is None:
+                self.errors += 1
+            else:
+                self.frames += 1
+                out.append(frame)
+        if len(buf) > self.max_buffer:
+            # no checksum for far too long: garbage or wrong baud rate
+            del buf[:-len(CHECKSUM_TAG)]
+        return out
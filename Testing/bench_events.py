@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+Event detection and event log check.
+
+Feeds EventDetector a SmartShunt-style stream (main block followed by a
+history block, H1...) and checks that each real transition is logged
+exactly once and that steady state, including the history blocks in
+between, logs nothing.  Then times EventLog range queries on a large
+log.  Exits non-zero on a wrong event sequence or a query over 1 ms.
+Usage:
+  python bench_events.py [events]
+"""
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'Stabile Build'))
+from events import (EventDetector, EventLog, ALARM_ON, ALARM_OFF, RELAY_ON,
+                    RELAY_OFF, LOW_SOC, SOC_OK, ERROR, EVENT_NAMES)
+
+HISTORY = {'H1': '-52000', 'H2': '-13000', 'H3': '-60000', 'H4': '12'}
+
+
+def main_block(alarm='OFF', ar='0', relay='OFF', soc='800', err=None):
+    frame = {'V': '12800', 'I': '-1500', 'SOC': soc,
+             'Alarm': alarm, 'AR': ar, 'Relay': relay}
+    if err is not None:
+        frame['ERR'] = err
+    return frame
+
+
+def check_interleave():
+    # (main block, events expected from it); a history block follows each
+    script = [
+        (main_block(), []),
+        (main_block(), []),
+        (main_block('ON', '4', 'ON', '190'),
+         [(ALARM_ON, 4), (RELAY_ON, 0), (LOW_SOC, 190)]),
+        (main_block('ON', '4', 'ON', '190'), []),
+        (main_block('ON', '4', 'ON', '190'), []),
+        (main_block('ON', '4', 'OFF', '195'), [(RELAY_OFF, 0)]),
+        (main_block('ON', '5', 'OFF', '200', err='2'),
+         [(ALARM_ON, 5), (ERROR, 2)]),
+        (main_block('ON', '5', 'OFF', '210', err='2'), []),
+        (main_block('OFF', '0', 'OFF', '230', err='0'),
+         [(ALARM_OFF, 0), (SOC_OK, 230)]),
+        (main_block('OFF', '0', 'OFF', '230', err='0'), []),
+    ]
+    detect = EventDetector(low_soc_pct=20.0, hysteresis_pct=2.0)
+    ok = True
+    for t, (frame, want) in enumerate(script):
+        got = [(k, v) for _, k, v in detect.update(frame, 2*t)]
+        hist = detect.update(dict(HISTORY), 2*t + 1)
+        active = detect.alarm_active
+        if got != want or hist:
+            ok = False
+            print(f"block {t}: got {got} + history {hist}, want {want}")
+        if active != (frame['Alarm'] == 'ON'):
+            ok = False
+            print(f"block {t}: alarm_active {active} after history block")
+    print(f"interleave : {'ok' if ok else 'FAILED'} "
+          f"({len(script)} main + {len(script)} history blocks)")
+    return ok
+
+
+def check_queries(n):
+    path = os.path.join(tempfile.mkdtemp(), 'events.log')
+    log = EventLog(path)
+    for i in range(n):
+        log.append(1e9 + i, i % len(EVENT_NAMES) + 1, i)
+    log.close()
+    t = time.perf_counter()
+    log = EventLog(path)
+    print(f"load       : {n} events in {time.perf_counter() - t:.3f} s")
+    worst = 0.0
+    for i in range(1000):
+        t0 = 1e9 + (i*7919) % n
+        t = time.perf_counter()
+        log.query(t0, t0 + 100, ALARM_ON)
+        log.query(t0, t0 + 100)
+        worst = max(worst, (time.perf_counter() - t)/2)
+    log.close()
+    print(f"query      : worst {worst*1e3:.3f} ms (target < 1 ms)")
+    return worst < 1e-3
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    ok = check_interleave()
+    ok = check_queries(n) and ok
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
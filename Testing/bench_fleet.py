@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+"""
+Fleet push / aggregator end-to-end check.
+
+Starts aggregator.serve() on a free localhost port and drives real
+fleet.FleetPusher instances against it:
+  offline     a unit spools while the aggregator is unreachable, then drains
+  re-send     a batch POSTed twice (lost ack) is stored once
+  epoch       a unit whose spool is wiped keeps its id under a new epoch
+  concurrent  N units pushing at the same time
+Every frame carries a counter, and the frames Store.frames() folds back
+must equal what each unit recorded, merged block by block.  Exits
+non-zero on any lost or duplicated row.
+Usage:
+  python bench_fleet.py [units] [frames per unit]
+"""
+import json
+import os
+import shutil
+import socket
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'Stabile Build'))
+import aggregator
+from fleet import FleetPusher, encode_batch
+
+HISTORY = {'H1': '-52000', 'H2': '-13000', 'H3': '-60000'}
+
+
+def block(n):
+    # main and history blocks alternate, as from a SmartShunt
+    if n % 2:
+        return dict(HISTORY, H4=str(n//20), N=str(n))
+    return {'V': str(12800 + n % 7), 'I': '-1500', 'SOC': str(800 - n//50),
+            'N': str(n)}
+
+
+class Unit:
+    """One simulated VictronPi: its pusher plus the frames it should have."""
+
+    def __init__(self, tmp, name, url, threaded=False, **kw):
+        self.name, self.tmp = name, tmp
+        self.want, self.state, self.n = [], {}, 0
+        self.pusher = self._pusher(url, threaded, **kw)
+
+    def _pusher(self, url, threaded=False, **kw):
+        spool = os.path.join(self.tmp, f'{self.name}.db')
+        p = FleetPusher(url, self.name, spool, **kw)
+        if not threaded:
+            p.db = p._open()    # else the push thread opens its own
+        return p
+
+    def record(self, count):
+        for _ in range(count):
+            frame = block(self.n)
+            t = 1e9 + self.n*0.5
+            self.pusher.record(frame, t)
+            self.state.update(frame)
+            self.want.append((t, dict(self.state)))
+            self.n += 1
+
+    def wipe(self, url):
+        self.pusher.db.close()
+        os.remove(os.path.join(self.tmp, f'{self.name}.db'))
+        old = self.pusher.epoch
+        self.pusher = self._pusher(url)
+        return old
+
+    def pending(self):
+        return self.pusher.db.execute(
+            'SELECT count(*) FROM outbox').fetchone()[0]
+
+
+def check(store, unit, label):
+    got = store.frames(unit.name, 0, 2e9)
+    ok = got == unit.want
+    if not ok:
+        have = [int(f.get('N', -1)) for _, f in got]
+        lost = len(set(range(unit.n)) - set(have))
+        print(f"{label}: {unit.name} has {len(got)} frames, want "
+              f"{len(unit.want)} ({lost} lost, "
+              f"{len(have) - len(set(have))} duplicated)")
+    return ok
+
+
+def closed_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def post(url, payload):
+    req = urllib.request.Request(url + '/push', data=payload, method='POST')
+    with urllib.request.urlopen(req, timeout=10) as resp:
+        return json.loads(resp.read().decode('utf-8'))['ack']
+
+
+def main():
+    units = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    frames = int(sys.argv[2]) if len(sys.argv) > 2 else 600
+    tmp = tempfile.mkdtemp()
+    server = aggregator.serve('127.0.0.1', 0, os.path.join(tmp, 'fleet.db'))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    store = aggregator.Handler.store
+    url = f'http://127.0.0.1:{server.server_address[1]}'
+    ok = True
+
+    # offline: nothing listening, rows must stay in the spool
+    unit = Unit(tmp, 'offline', f'http://127.0.0.1:{closed_port()}',
+                batch=100, timeout=1.0)
+    for _ in range(5):
+        unit.record(frames//5)
+        unit.pusher.flush()
+    spooled = unit.pending()
+    unit.pusher.url = url + '/push'
+    unit.pusher.flush()
+    good = spooled == frames and not unit.pending() and check(store, unit,
+                                                              'offline')
+    print(f"offline    : {spooled} rows spooled, {unit.pending()} left after "
+          f"reconnect, {'ok' if good else 'FAILED'}")
+    ok = ok and good
+
+    # re-send: the same batch twice, as after an ack lost on the way back
+    unit = Unit(tmp, 'resend', url)
+    unit.record(frames)
+    unit.pusher._spool()
+    rows = [[s, t, k, json.loads(d)] for s, t, k, d in unit.pusher.db.execute(
+        'SELECT seq, ts, key, data FROM outbox ORDER BY seq')]
+    payload = encode_batch(unit.name, unit.pusher.epoch, rows)
+    acks = [post(url, payload) for _ in range(3)]
+    unit.pusher.flush()      # and once more through the pusher itself
+    good = acks == [rows[-1][0]]*3 and check(store, unit, 're-send')
+    print(f"re-send    : acks {acks}, {'ok' if good else 'FAILED'}")
+    ok = ok and good
+
+    # epoch: spool wiped between two runs, seqs restart at 1
+    unit = Unit(tmp, 'epoch', url)
+    unit.record(frames//2)
+    unit.pusher.flush()
+    old = unit.wipe(url)
+    unit.record(frames - frames//2)
+    unit.pusher.flush()
+    good = unit.pusher.epoch != old and check(store, unit, 'epoch')
+    print(f"epoch      : {old:x} -> {unit.pusher.epoch:x}, "
+          f"{'ok' if good else 'FAILED'}")
+    ok = ok and good
+
+    # concurrent: every unit pushing from its own thread at once
+    fleet = [Unit(tmp, f'van{i:03d}', url, threaded=True, interval_s=0.05,
+                  batch=200) for i in range(units)]
+
+    def run(unit):
+        unit.pusher.start()
+        for _ in range(10):
+            unit.record(frames//10)
+            time.sleep(0.01)
+        unit.pusher.stop()
+
+    t = time.perf_counter()
+    threads = [threading.Thread(target=run, args=(u,)) for u in fleet]
+    for th in threads:
+        th.start()
+    for th in threads:
+        th.join()
+    took = time.perf_counter() - t
+    bad = sum(not check(store, u, 'concurrent') for u in fleet)
+    print(f"concurrent : {units} units x {frames} frames in {took:.2f} s, "
+          f"{bad} units wrong, {'ok' if not bad else 'FAILED'}")
+    ok = ok and not bad
+
+    server.shutdown()
+    server.server_close()
+    shutil.rmtree(tmp, ignore_errors=True)
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
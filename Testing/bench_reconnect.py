@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""
+VE.Direct hot-plug recovery check.
+
+Runs connection.VictronLink against a simulated serial bus: a SmartShunt
+adapter that is unplugged and replugged (onto a different /dev/ttyUSBn
+each time) next to a GPS adapter that never sends VE.Direct.  Measures
+the time from each replug to the first bytes read, both here and as
+reported by the link itself (last_recovery_s), and fails if the worst
+case of either is not under the 1 s target.  No hardware or pyserial
+needed.
+Usage:
+  python bench_reconnect.py [replugs]
+"""
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+import types
+
+TARGET_S = 1.0
+
+
+# ---- simulated pyserial ----
+class SerialException(Exception):
+    pass
+
+
+class Bus:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.shunt_dev = '/dev/ttyUSB0'   # None while unplugged
+        self.frame = self._frame()
+
+    @staticmethod
+    def _frame():
+        body = b'\r\nPID\t0xA389\r\nSER#\tHQ2130ABCDE\r\nV\t12800\r\nI\t-1500'
+        body += b'\r\nChecksum\t'
+        return body + bytes([-sum(body) & 0xFF])
+
+    def comports(self):
+        ports = [Port('/dev/ttyUSB9', 'GPS0001')]
+        with self.lock:
+            if self.shunt_dev:
+                ports.append(Port(self.shunt_dev, 'FTSHUNT1'))
+        return ports
+
+
+class Port:
+    def __init__(self, device, serial_number):
+        self.device = device
+        self.serial_number = serial_number
+        self.vid = 0x0403
+
+
+BUS = Bus()
+
+
+class Serial:
+    def __init__(self, device, baud, timeout=0.1):
+        with BUS.lock:
+            if device not in ('/dev/ttyUSB9', BUS.shunt_dev):
+                raise SerialException(f"could not open port {device}")
+        self.device = device
+        self.timeout = timeout
+        self.in_waiting = 0
+
+    def read(self, n):
+        if self.device == '/dev/ttyUSB9':
+            time.sleep(0.05)
+            return b'$GPGGA,,,,,,0,00,,,M,,M,,*66\r\n'
+        with BUS.lock:
+            gone = self.device != BUS.shunt_dev
+        if gone:
+            raise SerialException('device reports readiness to read but '
+                                  'returned no data')
+        time.sleep(0.02)
+        return BUS.frame
+
+    def close(self):
+        pass
+
+
+def install_fake_serial():
+    serial = types.ModuleType('serial')
+    serial.Serial, serial.SerialException = Serial, SerialException
+    tools = types.ModuleType('serial.tools')
+    list_ports = types.ModuleType('serial.tools.list_ports')
+    list_ports.comports = BUS.comports
+    serial.tools, tools.list_ports = tools, list_ports
+    sys.modules.update({'serial': serial, 'serial.tools': tools,
+                        'serial.tools.list_ports': list_ports})
+
+
+def main():
+    replugs = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    install_fake_serial()
+    sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..',
+                                    'Stabile Build'))
+    from connection import VictronLink
+
+    cache = os.path.join(tempfile.mkdtemp(), 'port_cache.json')
+    link = VictronLink(cache_path=cache)
+    last_rx = [0.0]
+    stop = threading.Event()
+
+    def reader():
+        while not stop.is_set():
+            if link.read():
+                last_rx[0] = time.monotonic()
+
+    t = time.monotonic()
+    threading.Thread(target=reader, daemon=True).start()
+    while not last_rx[0]:
+        time.sleep(0.01)
+    print(f"cold start : {last_rx[0] - t:.3f} s on {link.device}")
+
+    rnd = random.Random(1)
+    worst = reported = 0.0
+    for i in range(replugs):
+        with BUS.lock:
+            BUS.shunt_dev = None
+        time.sleep(rnd.uniform(0.2, 2.0))
+        with BUS.lock:
+            BUS.shunt_dev = f'/dev/ttyUSB{i % 2}'
+            plugged = time.monotonic()
+            last_rx[0] = 0.0
+        while last_rx[0] < plugged:
+            time.sleep(0.005)
+        took = last_rx[0] - plugged
+        worst = max(worst, took)
+        reported = max(reported, link.last_recovery_s)
+        print(f"replug {i+1:2d}  : {took:.3f} s on {link.device}, link "
+              f"reports {link.last_recovery_s:.3f} s "
+              f"(down {link.last_outage_s:.1f} s)")
+    stop.set()
+
+    print(f"worst case : {worst:.3f} s, link reports {reported:.3f} s "
+          f"(target < {TARGET_S:.1f} s)")
+    sys.exit(0 if max(worst, reported) < TARGET_S else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+VE.Direct frame parser benchmark.
+
+Simulates the text streams of a SmartShunt, an MPPT charger and an
+inverter (all tags, valid checksums), cuts them into serial-sized reads
+and times FrameReader with the pure Python parser against the compiled
+_vedirect extension, if it has been built in 'Stabile Build'.
+Usage:
+  python bench_vedirect.py [frames]
+"""
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'Stabile Build'))
+import vedirect
+
+SHUNT = ['PID', 'V', 'VS', 'I', 'P', 'CE', 'SOC', 'TTG', 'Alarm', 'Relay',
+         'AR', 'BMV', 'FW', 'MON', 'H1', 'H2', 'H3', 'H4', 'H5', 'H6', 'H7',
+         'H8', 'H9', 'H10', 'H11', 'H12', 'H15', 'H16', 'H17', 'H18']
+MPPT = ['PID', 'FW', 'SER#', 'V', 'I', 'VPV', 'PPV', 'CS', 'MPPT', 'OR',
+        'ERR', 'LOAD', 'IL', 'H19', 'H20', 'H21', 'H22', 'H23', 'HSDS']
+INVERTER = ['PID', 'FW', 'SER#', 'MODE', 'CS', 'AC_OUT_V', 'AC_OUT_I',
+            'AC_OUT_S', 'V', 'AR', 'WARN', 'OR']
+
+# BMV-700 style history block: sent as a second frame every 10 s
+SHUNT_A, SHUNT_B = SHUNT[:18], SHUNT[18:]
+
+
+def frame(tags, rnd):
+    body = b''
+    for tag in tags:
+        if tag == 'PID':
+            val = rnd.choice(['0xA389', '0xA053', '0xA231'])
+        elif tag in ('Alarm', 'Relay', 'LOAD'):
+            val = rnd.choice(['ON', 'OFF'])
+        elif tag in ('SER#', 'BMV', 'FW', 'OR'):
+            val = 'HQ2130ABCDE' if tag == 'SER#' else '0x00000000' if tag == 'OR' else '0416'
+        else:
+            val = str(rnd.randint(-30000, 30000))
+        body += b'\r\n' + tag.encode() + b'\t' + val.encode()
+    body += b'\r\nChecksum\t'
+    return body + bytes([-sum(body) & 0xFF])
+
+
+def simulate(n, seed=1):
+    rnd = random.Random(seed)
+    streams = [SHUNT_A, SHUNT_B, MPPT, INVERTER]
+    return b''.join(frame(streams[i % len(streams)], rnd) for i in range(n))
+
+
+def run(stream, parse, chunk=64):
+    reader = vedirect.FrameReader(parse=parse)
+    feed = reader.feed
+    t = time.perf_counter()
+    for i in range(0, len(stream), chunk):
+        feed(stream[i:i+chunk])
+    return time.perf_counter() - t, reader.frames
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    stream = simulate(n)
+    print(f"{n} frames, {len(stream)/1e6:.1f} MB")
+
+    samples = simulate(1000, seed=2).split(b'\r\nPID')
+    samples = [b'\r\nPID' + s for s in samples[1:]]
+    t_py, frames = run(stream, vedirect.py_parse_frame)
+    print(f"python   : {t_py:.3f} s  {frames/t_py:9.0f} frames/s")
+    if not vedirect.ACCELERATED:
+        print("compiled : _vedirect not built, see the top of _vedirect.c")
+        return
+    for s in samples + [s[:-1] + b'\x00' for s in samples]:
+        assert vedirect.py_parse_frame(s) == vedirect.parse_frame(s)
+    t_c, frames = run(stream, vedirect.parse_frame)
+    print(f"compiled : {t_c:.3f} s  {frames/t_c:9.0f} frames/s")
+    print(f"speedup  : {t_py/t_c:.2f}x (whole FrameReader path)")
+
+    for name, fn in (('python', vedirect.py_parse_frame),
+                     ('compiled', vedirect.parse_frame)):
+        t = time.perf_counter()
+        for _ in range(10):
+            for s in samples:
+                fn(s)
+        us = (time.perf_counter() - t)/(10*len(samples))*1e6
+        print(f"parse_frame {name:8s}: {us:.2f} us/frame")
+
+
+if __name__ == '__main__':
+    main()